@@ -7,11 +7,42 @@ Autora: Ingrid Alves Rocha
 Matrícula: 202045348
 """
 
+import logging
 import time
+from collections import deque
+
+import numpy as np
+
 from r2a.ir2a import IR2A
 from player.parser import *
 
+logger = logging.getLogger(__name__)
+
+
+def _throughput_kernel(throughput_window, deviations):
+    """Calcula média, variância e probabilidade de uma janela de throughput em uma única chamada.
+
+    Parâmetros:
+    throughput_window (ndarray): Valores de throughput da janela (não vazia).
+    deviations (ndarray): Buffer do mesmo tamanho, sobrescrito com os desvios em relação à média.
+
+    Retorna:
+    tuple: Média, variância e probabilidade.
+    """
+    # A média é calculada uma única vez e reaproveitada na variância, sem arrays temporários
+    mean = float(throughput_window.mean())
+    np.subtract(throughput_window, mean, out=deviations)
+    variance = float(deviations.dot(deviations)) / throughput_window.size
+    denominator = mean + variance
+    probability = mean / denominator if denominator else 0.0  # Prevents division by zero
+    return mean, variance, probability
+
+
 class r2a_Ingrid(IR2A):
+    # IR2A mantém __dict__ para os atributos da base; os atributos abaixo usam slots
+    __slots__ = ('max_throughput_records', 'recent_throughputs', '_version', 'request_start_ns',
+                 'quality_options', 'active_quality_level', 'segment_size_manager')
+
     def __init__(self, identifier: int):
         """Inicializa a classe r2a_Ingrid para adaptação de streaming adaptativo.
 
@@ -21,11 +52,13 @@ class r2a_Ingrid(IR2A):
         super().__init__(identifier)
         
         self.max_throughput_records = 5  # Quantidade máxima de registros de throughput armazenados
-        self.recent_throughputs = []  # Lista para armazenar valores recentes de throughput
-        self.request_start_time = 0  # Marca o tempo da última requisição
-        self.quality_options = []  # Armazena os níveis de qualidade disponíveis
+        self.recent_throughputs = deque(maxlen=self.max_throughput_records)  # Fila circular com os valores recentes de throughput
+        self._version = 0  # Incrementado a cada alteração da janela de throughput
+        self.request_start_ns: int = 0  # Marca o instante (time.monotonic_ns) da última requisição
+        self.quality_options = ()  # Armazena os níveis de qualidade disponíveis (imutáveis durante o MPD)
         self.active_quality_level = 0  # Indica a qualidade de vídeo em uso
         self.segment_size_manager = Adaptive_Segment_Manager(self.max_throughput_records)  # Instância do gerenciador de segmentos
+
     def handle_xml_request(self, msg):
         """Processa a requisição XML e encaminha para o próximo nível.
 
@@ -33,8 +66,7 @@ class r2a_Ingrid(IR2A):
         msg: Dados da requisição XML.
         """
         if msg is not None:
-            current_time = time.time()
-            self.request_start_time = current_time
+            self.request_start_ns = time.monotonic_ns()
             self.send_down(msg)
 
     def handle_xml_response(self, msg):
@@ -44,76 +76,93 @@ class r2a_Ingrid(IR2A):
         msg: Dados da resposta XML contendo informações do MPD.
         """
         mpd_data = parse_mpd(msg.get_payload())  
-        self.quality_options = mpd_data.get_qi()
+        self.quality_options = tuple(mpd_data.get_qi())
+        self.segment_size_manager.update_quality_neighbors(len(self.quality_options))
         
-        elapsed_time = time.time() - self.request_start_time
-        if elapsed_time > 0:
-            calculated_throughput = msg.get_bit_length() / elapsed_time
+        elapsed_ns = time.monotonic_ns() - self.request_start_ns
+        if elapsed_ns > 0:
+            calculated_throughput = msg.get_bit_length() / (elapsed_ns * 1e-9)
             self.add_throughput_record(calculated_throughput)
 
         self.send_up(msg)
 
-    def handle_segment_size_request(self, msg):
+    def handle_segment_size_request(self, msg, _monotonic_ns=time.monotonic_ns):
         """Processa a solicitação de tamanho do segmento e ajusta a qualidade.
 
         Parâmetros:
         msg: Mensagem contendo a solicitação do segmento.
+        _monotonic_ns: Vinculado na definição para evitar a busca global a cada segmento.
         """
-        self.request_start_time = time.time()
-        self.segment_size_manager.update_throughput_history(self.recent_throughputs)
+        self.request_start_ns = _monotonic_ns()
+
+        if not self.recent_throughputs:
+            # Sem medições de throughput a adaptação não altera o nível atual (sempre o nível 0 após initialize)
+            if self.quality_options:
+                msg.add_quality_id(self.quality_options[self.active_quality_level])
+            self.send_down(msg)
+            return
+
+        self.segment_size_manager.update_throughput_history(self.recent_throughputs, self._version)
         selected_quality_index = self.segment_size_manager.update_video_quality(self.active_quality_level, self.quality_options)
         self.active_quality_level = selected_quality_index
 
-        if 0 <= selected_quality_index < len(self.quality_options):
-            msg.add_quality_id(self.quality_options[selected_quality_index])
+        if self.quality_options:  # update_video_quality já limita o índice a [0, len - 1]
+            selected_quality = self.quality_options[selected_quality_index]
+            msg.add_quality_id(selected_quality)
 
         self.send_down(msg)
 
-    def handle_segment_size_response(self, msg):
+    def handle_segment_size_response(self, msg, _monotonic_ns=time.monotonic_ns):
         """Processa a resposta do tamanho do segmento e atualiza throughput.
 
         Parâmetros:
         msg: Mensagem contendo informações sobre o segmento.
+        _monotonic_ns: Vinculado na definição para evitar a busca global a cada segmento.
         """
-        elapsed_time = time.time() - self.request_start_time
+        elapsed_ns = _monotonic_ns() - self.request_start_ns
 
-        if elapsed_time > 0:
-            calculated_throughput = msg.get_bit_length() / elapsed_time
+        if elapsed_ns > 0:
+            calculated_throughput = msg.get_bit_length() / (elapsed_ns * 1e-9)
             self.add_throughput_record(calculated_throughput)
 
         self.send_up(msg)
 
-    def add_throughput_record(self, new_value: float):
+    def add_throughput_record(self, new_value: float, _append=deque.append):
         """Adiciona um novo valor de throughput, mantendo o histórico atualizado.
 
         Parâmetros:
         new_value (float): Novo valor de throughput medido.
+        _append: deque.append vinculado na definição, evitando a busca do método a cada chamada.
         """
-        if len(self.recent_throughputs) >= self.max_throughput_records:
-            self.recent_throughputs.pop(0)
-        self.recent_throughputs.append(new_value)
+        _append(self.recent_throughputs, new_value)  # maxlen descarta automaticamente o valor mais antigo
+        self._version += 1
+
+    def reset_throughput_records(self):
+        """Esvazia a janela de throughput."""
+        self.recent_throughputs.clear()
+        self._version += 1
 
     def initialize(self):
         """Inicializa os recursos necessários para o funcionamento do sistema."""
         super().initialize()
-        self.request_start_time = 0
-        self.recent_throughputs.clear()
+        self.request_start_ns = 0
+        self.reset_throughput_records()
         self.active_quality_level = 0
         print("Sistema inicializado. Recursos prontos para uso.")
 
     def finalization(self):
         """Libera recursos e redefine variáveis para evitar consumo desnecessário de memória."""
         super().finalization()
-        self.request_start_time = None
-        self.recent_throughputs = []
+        self.request_start_ns = None
+        self.reset_throughput_records()
         self.active_quality_level = None
         print("Recursos liberados. Sistema pronto para encerramento.")
 
 
-
-from collections import deque
-
 class Adaptive_Segment_Manager:
+    __slots__ = ('maximum_throughput_records', '_ring', '_deviations', '_n', 'throughput_mean',
+                 'throughput_variability', '_cached_version', '_cached_probability', '_prev_idx', '_next_idx')
+
     def __init__(self, max_throughput_records: int):
         """Inicializa o gerenciador de segmentos adaptativos.
 
@@ -121,64 +170,67 @@ class Adaptive_Segment_Manager:
         max_throughput_records (int): Número máximo de registros de throughput armazenados.
         """
         self.maximum_throughput_records = max_throughput_records  # Keeping consistency with r2a_Ingrid
-        self.throughput_records = deque(maxlen=max_throughput_records)  # List of throughput records
+        self._ring = np.empty(max_throughput_records, dtype=np.float64)  # Preallocated buffer holding the throughput records
+        self._deviations = np.empty(max_throughput_records, dtype=np.float64)  # Preallocated buffer for the deviations from the mean
+        self._n = 0  # Number of valid records in _ring
         self.throughput_mean = 0  # Mean throughput value
         self.throughput_variability = 0  # Variability in throughput
+        self._cached_version = -1  # Version of the throughput window used in the last calculation
+        self._cached_probability = 0  # Probability computed for _cached_version
+        self._prev_idx = []  # Previous quality index for each quality index
+        self._next_idx = []  # Next quality index for each quality index
 
-    def update_throughput_history(self, recent_throughput_values):
-        """"Limpa os registros anteriores e adiciona novos valores de throughput.
+    def update_quality_neighbors(self, quality_level_count: int):
+        """Pré-calcula os índices vizinhos (anterior e próximo) de cada nível de qualidade do MPD.
+
+        Parâmetros:
+        quality_level_count (int): Quantidade de níveis de qualidade disponíveis.
+        """
+        self._prev_idx = [max(0, i - 1) for i in range(quality_level_count)]
+        self._next_idx = [min(quality_level_count - 1, i + 1) for i in range(quality_level_count)]
+
+    def update_throughput_history(self, recent_throughput_values, version: int):
+        """"Substitui os registros anteriores pelos novos valores de throughput.
         
         Parâmetros:
         recent_throughput_values (list): Lista contendo os novos valores de throughput.
+        version (int): Versão da janela de throughput; se não mudou, os valores calculados são reaproveitados.
         """
-        self.throughput_records.clear()
-        self.throughput_records.extend(recent_throughput_values)
+        if version == self._cached_version:
+            return
+
+        # Reaproveita o buffer alocado no __init__ em vez de criar uma nova estrutura a cada atualização
+        self._n = len(recent_throughput_values)
+        np.copyto(self._ring[:self._n], recent_throughput_values)
+        self._cached_version = version
         self.calculate_mean_and_variability()
 
     def calculate_mean_and_variability(self):
-        """"Calcula a média (throughput_mean) e a variabilidade (throughput_variability) dos valores armazenados."""
-        if not self.throughput_records:
+        """"Calcula a média (throughput_mean), a variabilidade (throughput_variability) e a probabilidade dos valores armazenados."""
+        if not self._n:
             self.throughput_mean = 0
             self.throughput_variability = 0
+            self._cached_probability = 0
             return
-        
-        self.throughput_mean = sum(self.throughput_records) / len(self.throughput_records)
-        self.throughput_variability = sum((value - self.throughput_mean) ** 2 for value in self.throughput_records) / len(self.throughput_records)
-
-    def calculate_probability(self):
-        """Calcula a probabilidade com base na variabilidade do throughput."""
-        weighted_variability = self.throughput_variability  # Usa a variabilidade calculada
-        probability = self.throughput_mean / (self.throughput_mean + weighted_variability) if (self.throughput_mean + weighted_variability) != 0 else 0  # Prevents division by zero
-        print(f"Probability: {probability:.4f}\n")
-        return probability
-
-    def calculate_tau_and_theta(self, current_quality_level: int, quality_levels: list):
-        """Calcula os valores de tau e theta para ajuste da qualidade do vídeo.
-
-        Parâmetros:
-        current_quality_level (int): Índice da qualidade atual.
-        quality_levels (list): Lista dos níveis de qualidade disponíveis.
-
-        Retorna:
-        tuple: Valores de tau e theta.
-        """
-        probability = self.calculate_probability()
 
-        # Cálculo de tau e theta conforme descrito no artigo
-        tau_value = (1 - probability) * (current_quality_level - quality_levels[max(0, current_quality_level - 1)])  # Approaches previous level
-        theta_value = probability * (quality_levels[min(len(quality_levels) - 1, current_quality_level + 1)] - current_quality_level)  # Approaches next level
+        self.throughput_mean, self.throughput_variability, self._cached_probability = _throughput_kernel(
+            self._ring[:self._n], self._deviations[:self._n])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Probability: %.4f", self._cached_probability)
 
-        print(f"Tau: {tau_value:.4f}\n")
-        print(f"Theta: {theta_value:.4f}\n")
+    def calculate_probability(self):
+        """Retorna a probabilidade calculada para a janela de throughput atual."""
+        return self._cached_probability
 
-        return tau_value, theta_value
+    def update_video_quality(self, current_quality_level: int, quality_level_list: tuple):
+        """Atualiza a qualidade do vídeo com base nos valores de tau e theta.
 
-    def update_video_quality(self, current_quality_level: int, quality_level_list: list):
-        """Atualiza a qualidade do vídeo com base nos cálculos de tau e theta.
+        Com tau = (1 - p) * (atual - anterior) e theta = p * (próximo - atual), o novo nível
+        atual - tau + theta simplifica para anterior + p * (próximo - anterior).
 
         Parâmetros:
         current_quality_level (int): Índice da qualidade atual.
-        quality_level_list (list): Lista dos níveis de qualidade disponíveis.
+        quality_level_list (tuple): Níveis de qualidade disponíveis.
 
         Retorna:
         int: Índice atualizado de qualidade.
@@ -186,21 +238,12 @@ class Adaptive_Segment_Manager:
         if not quality_level_list:
             return current_quality_level  # Se a lista estiver vazia, mantém a qualidade atual
 
-        quality_level_indices = list(range(len(quality_level_list)))  # Gera uma lista de índices de qualidade
-        tau_value, theta_value = self.calculate_tau_and_theta(current_quality_level, quality_level_indices)
+        probability = self.calculate_probability()
+        previous_level = self._prev_idx[current_quality_level]
+        next_level = self._next_idx[current_quality_level]
 
-        updated_quality_level = round(current_quality_level - tau_value + theta_value)  # Ajusta para o valor válido mais próximo
+        updated_quality_level = round(previous_level + probability * (next_level - previous_level))  # Ajusta para o valor válido mais próximo
         updated_quality_level = max(0, min(len(quality_level_list) - 1, updated_quality_level))  # Garante que o valor esteja dentro dos limites válidos
 
         return updated_quality_level
 
-    def update_throughput_list(self, new_throughput_list: list):
-        """Atualiza a lista de registros de throughput com novos valores.
-        
-        Parâmetros:
-        new_throughput_list (list): Lista contendo os novos valores de throughput.
-        """
-        self.throughput_records = deque(new_throughput_list, maxlen=self.maximum_throughput_records)
-        self.total_records = len(self.throughput_records)
-        self.throughput_mean = sum(self.throughput_records) / self.total_records if self.total_records > 0 else 0   # Previne divisão por zero
-        print(f"Updated throughput list: {self.throughput_records}\n")